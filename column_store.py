@@ -0,0 +1,111 @@
+### Columnar, memory-mapped store for processed frames
+
+'''
+Reading preprocessed_df back from processed_data.h5 copies every column
+into fresh arrays in every process that loads it. Here each column is a
+raw binary file, with a JSON schema next to them:
+
+    processed_profile/
+        schema.json
+        date_time.bin
+        energy_kwh.bin
+        cost_cents.bin
+
+open_store() maps the files with np.memmap, so opening takes the same
+time whatever the size. Processes that open the same store share one
+copy of each column through the page cache.
+'''
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+SCHEMA_FILE = "schema.json"
+
+
+def _column_arrays(name, values):
+    """Return (schema entry, {file name: array}) for one column"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = np.asarray(values.cat.codes)
+        return ({"name": name, "kind": "category", "dtype": codes.dtype.str,
+                 "file": f"{name}.bin", "categories": values.cat.categories.tolist()},
+                {f"{name}.bin": codes})
+    array = np.asarray(values)
+    if array.dtype.kind == "M":
+        array = array.astype("datetime64[ns]")
+    elif array.dtype.kind not in "biuf":
+        raise TypeError(f"Column {name!r} has dtype {values.dtype}, which cannot be memory-mapped")
+    return ({"name": name, "kind": "array", "dtype": array.dtype.str, "file": f"{name}.bin"},
+            {f"{name}.bin": array})
+
+
+def write_store(df, directory):
+    """Write df as one raw file per column plus schema.json
+
+    The index is stored as a column too. The store is written to a
+    temporary directory and renamed into place, so readers never see a
+    half-written store.
+    """
+    index_name = df.index.name or "index"
+    if index_name in df.columns:
+        raise ValueError(f"Index name {index_name!r} clashes with a column")
+    columns = [(index_name, pd.Series(df.index))] + [(name, df[name]) for name in df.columns]
+
+    tmp_directory = f"{directory}.tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    schema = {"length": len(df), "index": index_name, "columns": []}
+    for name, values in columns:
+        entry, arrays = _column_arrays(str(name), values)
+        schema["columns"].append(entry)
+        for file_name, array in arrays.items():
+            np.ascontiguousarray(array).tofile(os.path.join(tmp_directory, file_name))
+    with open(os.path.join(tmp_directory, SCHEMA_FILE), "w") as f:
+        json.dump(schema, f, indent=2)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.rename(tmp_directory, directory)
+
+
+def open_columns(directory, columns=None):
+    """Return {name: read-only np.memmap} for the stored columns
+
+    Categorical columns come back as their integer codes.
+    """
+    with open(os.path.join(directory, SCHEMA_FILE)) as f:
+        schema = json.load(f)
+    arrays = {}
+    for entry in schema["columns"]:
+        if columns is not None and entry["name"] not in columns:
+            continue
+        if schema["length"] == 0:
+            arrays[entry["name"]] = np.empty(0, dtype=entry["dtype"])
+        else:
+            arrays[entry["name"]] = np.memmap(os.path.join(directory, entry["file"]),
+                                              dtype=entry["dtype"], mode="r",
+                                              shape=(schema["length"],))
+    return arrays
+
+
+def open_store(directory, columns=None):
+    """Return the stored frame with columns backed by read-only memory maps"""
+    with open(os.path.join(directory, SCHEMA_FILE)) as f:
+        schema = json.load(f)
+    wanted = None if columns is None else set(columns) | {schema["index"]}
+    arrays = open_columns(directory, wanted)
+    data = {}
+    for entry in schema["columns"]:
+        name = entry["name"]
+        if name not in arrays:
+            continue
+        values = arrays[name]
+        if entry["kind"] == "category":
+            values = pd.Categorical.from_codes(values, entry["categories"])
+        data[name] = values
+    index = pd.Index(data.pop(schema["index"]), name=schema["index"], copy=False)
+    # One block per column keeps pandas from copying them into a 2-D block
+    return pd.concat([pd.Series(values, index=index, name=name, copy=False)
+                      for name, values in data.items()], axis=1, copy=False)
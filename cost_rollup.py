@@ -0,0 +1,136 @@
+### Precomputed rollups for time-range cost queries
+
+'''
+Once cost_cents is computed, the usual questions are "what did we use and
+pay between t1 and t2" and "how much per day in each tariff band".
+Answering them with df.loc[t1:t2].sum() rescans the rows every time.
+CostRollup keeps prefix sums instead:
+
+    cum_cost[i] = cost of rows 0 .. i-1
+
+so any range costs two binary searches and a subtraction. New rows are
+added to the end of the arrays, and the daily per-band totals live in
+(day, band) arrays that np.add.at updates in place, so the index never
+needs a rebuild while the profile grows hour by hour.
+'''
+
+import numpy as np
+import pandas as pd
+
+from tariffs import DEFAULT_TARIFF
+
+
+class CostRollup:
+    """Prefix sums and daily per-band totals over a processed profile
+
+    df is indexed by date_time in time order and has energy_kwh, plus
+    cost_cents if it has already been costed. The band of a row is the
+    rate it was charged at under schedule.
+    """
+    def __init__(self, df=None, schedule=DEFAULT_TARIFF):
+        self.schedule = schedule
+        self._size = 0
+        self._times = np.empty(0, dtype="int64")
+        self._cum_energy = np.zeros(1)
+        self._cum_cost = np.zeros(1)
+        # Daily totals per band, one row per day from the first day on
+        self._bands = np.unique(schedule.table)
+        self._first_day = None
+        self._days = 0
+        self._tz = None
+        self._band_rows = np.zeros((0, len(self._bands)), dtype="int64")
+        self._band_energy = np.zeros((0, len(self._bands)))
+        self._band_cost = np.zeros((0, len(self._bands)))
+        if df is not None:
+            self.append(df)
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, size, days):
+        # Grow by doubling so that appending row by row stays amortized O(1)
+        if size > len(self._times):
+            capacity = max(size, 2 * len(self._times), 1024)
+            self._times = np.resize(self._times, capacity)
+            self._cum_energy = np.resize(self._cum_energy, capacity + 1)
+            self._cum_cost = np.resize(self._cum_cost, capacity + 1)
+        if days > len(self._band_rows):
+            capacity = max(days, 2 * len(self._band_rows), 64)
+            extra = capacity - len(self._band_rows)
+            self._band_rows = np.pad(self._band_rows, ((0, extra), (0, 0)))
+            self._band_energy = np.pad(self._band_energy, ((0, extra), (0, 0)))
+            self._band_cost = np.pad(self._band_cost, ((0, extra), (0, 0)))
+
+    def append(self, df):
+        """Add rows that come after everything already in the rollup"""
+        if not len(df):
+            return
+        index = pd.DatetimeIndex(df.index)
+        times = index.values.astype("datetime64[ns]").view("int64")
+        if np.any(np.diff(times) < 0):
+            raise ValueError("Rows must be in time order")
+        if self._size and times[0] < self._times[self._size - 1]:
+            raise ValueError(f"Rows starting at {index[0]} come before the end of the rollup")
+
+        energy = df["energy_kwh"].values.astype("float64")
+        rates = self.schedule.rates_for(index)
+        if "cost_cents" in df:
+            cost = df["cost_cents"].values.astype("float64")
+        else:
+            cost = rates * energy
+
+        # Calendar days of the wall clock, as in TariffSchedule.rates_for()
+        if self._first_day is None:
+            self._tz = index.tz
+        local = index.tz_localize(None) if index.tz is not None else index
+        days = local.values.astype("datetime64[D]").view("int64")
+        if self._first_day is None:
+            self._first_day = days[0]
+        days = days - self._first_day
+        bands = np.searchsorted(self._bands, rates)
+
+        start, stop = self._size, self._size + len(df)
+        self._reserve(stop, days[-1] + 1)
+        self._times[start:stop] = times
+        self._cum_energy[start + 1:stop + 1] = self._cum_energy[start] + np.cumsum(energy)
+        self._cum_cost[start + 1:stop + 1] = self._cum_cost[start] + np.cumsum(cost)
+        self._size = stop
+
+        np.add.at(self._band_rows, (days, bands), 1)
+        np.add.at(self._band_energy, (days, bands), energy)
+        np.add.at(self._band_cost, (days, bands), cost)
+        self._days = days[-1] + 1
+
+    def _bounds(self, start, end):
+        times = self._times[:self._size]
+        i = np.searchsorted(times, pd.Timestamp(start).value, side="left")
+        j = np.searchsorted(times, pd.Timestamp(end).value, side="left")
+        return i, max(i, j)
+
+    def energy_between(self, start, end):
+        """Return kWh used in [start, end)"""
+        i, j = self._bounds(start, end)
+        return self._cum_energy[j] - self._cum_energy[i]
+
+    def cost_between(self, start, end):
+        """Return cents charged in [start, end)"""
+        i, j = self._bounds(start, end)
+        return self._cum_cost[j] - self._cum_cost[i]
+
+    def _dates(self, days):
+        dates = (self._first_day + days).astype("datetime64[D]").astype("datetime64[ns]")
+        return pd.DatetimeIndex(dates, name="date").tz_localize(self._tz)
+
+    def daily_band_totals(self):
+        """Return energy_kwh and cost_cents per (date, rate)"""
+        days, bands = np.nonzero(self._band_rows[:self._days])
+        index = pd.MultiIndex.from_arrays(
+            [self._dates(days), pd.Index(self._bands[bands], name="rate")])
+        return pd.DataFrame({"energy_kwh": self._band_energy[days, bands],
+                             "cost_cents": self._band_cost[days, bands]}, index=index)
+
+    def daily_totals(self):
+        days = np.flatnonzero(self._band_rows[:self._days].any(axis=1))
+        return pd.DataFrame({"energy_kwh": self._band_energy[days].sum(axis=1),
+                             "cost_cents": self._band_cost[days].sum(axis=1)},
+                            index=self._dates(days))
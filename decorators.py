@@ -6,10 +6,29 @@ def do_twice(func):
     return wrapper_do_twice
 '''
 
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
 import functools
+import importlib
+import inspect
+import itertools
+import json
+import math
+import os
+import random
+import reprlib
+import struct
+import sys
+import threading
 import time
+import weakref
 
 def do_twice(func):
+    if inspect.iscoroutinefunction(func) or inspect.isasyncgenfunction(func):
+        return repeat(num_times=2)(func)
+
     @functools.wraps(func)
     def wrapper_do_twice(*args, **kwargs):
         func(*args, **kwargs)
@@ -17,6 +36,92 @@ def do_twice(func):
     return wrapper_do_twice
 
 
+def _timed_call(func, args, kwargs):
+    start_ns = time.perf_counter_ns()
+    value = func(*args, **kwargs)
+    return value, time.perf_counter_ns() - start_ns
+
+
+_PROCESS_WRAPPERS = weakref.WeakSet()
+
+
+def _timed_call_by_name(module, qualname, args, kwargs):
+    # Process workers get the function's name rather than the function, as
+    # whatever is stacked on top of repeat may not pickle. The worker looks
+    # the name up, unwraps down to repeat's wrapper and calls what it wraps
+    target = importlib.import_module(module)
+    for attr in qualname.split("."):
+        target = getattr(target, attr)
+    wrapper = inspect.unwrap(target, stop=lambda f: f in _PROCESS_WRAPPERS)
+    if wrapper not in _PROCESS_WRAPPERS:
+        raise TypeError(f"{module}.{qualname} is not decorated with "
+                        f"@repeat(executor='process')")
+    return _timed_call(wrapper.__wrapped__, args, kwargs)
+
+
+_EXECUTORS = {
+    "thread": concurrent.futures.ThreadPoolExecutor,
+    "process": concurrent.futures.ProcessPoolExecutor,
+}
+
+def repeat(num_times, *, executor=None, max_workers=None, return_all=False):
+    """Run the decorated function num_times and return the last value
+
+    Coroutine functions are awaited one run after the other and async
+    generators are iterated to the end num_times in a row.
+
+    With executor="thread" or "process" the runs are fanned out over a
+    pool of max_workers, the runtime of every run in seconds is kept in
+    .run_times, and return_all=True returns all values in run order.
+    Process runs need a function defined at module level, which the
+    workers import by name, so other decorators can be stacked on top.
+    """
+    if executor is not None and executor not in _EXECUTORS:
+        raise ValueError(f"Unknown executor: {executor!r}")
+
+    def decorator_repeat(func):
+        is_async = inspect.iscoroutinefunction(func) or inspect.isasyncgenfunction(func)
+        if executor is not None and is_async:
+            raise ValueError(f"executor={executor!r} does not support async functions")
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper_repeat(*args, **kwargs):
+                for _ in range(num_times):
+                    value = await func(*args, **kwargs)
+                return value
+        elif inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def wrapper_repeat(*args, **kwargs):
+                for _ in range(num_times):
+                    async for item in func(*args, **kwargs):
+                        yield item
+        elif executor is None:
+            @functools.wraps(func)
+            def wrapper_repeat(*args, **kwargs):
+                for _ in range(num_times):
+                    value = func(*args, **kwargs)
+                return value
+        else:
+            @functools.wraps(func)
+            def wrapper_repeat(*args, **kwargs):
+                if executor == "process":
+                    call = functools.partial(_timed_call_by_name, func.__module__,
+                                             func.__qualname__)
+                else:
+                    call = functools.partial(_timed_call, func)
+                with _EXECUTORS[executor](max_workers=max_workers) as pool:
+                    futures = [pool.submit(call, args, kwargs) for _ in range(num_times)]
+                    results = [future.result() for future in futures]
+                wrapper_repeat.run_times = [run_ns / 1e9 for _, run_ns in results]
+                values = [value for value, _ in results]
+                return values if return_all else values[-1]
+            wrapper_repeat.run_times = []
+            if executor == "process":
+                _PROCESS_WRAPPERS.add(wrapper_repeat)
+        return wrapper_repeat
+    return decorator_repeat
+
 
 
 def decorator(func):
@@ -30,28 +135,817 @@ def decorator(func):
 
 
 
-def timer(func):
-    """Print the runtime of the decorated function"""
-    @functools.wraps(func)
-    def wrapper_timer(*args, **kwargs):
-        start_time = time.perf_counter()    # 1
-        value = func(*args, **kwargs)
-        end_time = time.perf_counter()      # 2
-        run_time = end_time - start_time    # 3
-        print(f"Finished {func.__name__!r} in {run_time:.4f} secs")
-        return value
-    return wrapper_timer
+ENABLED = os.environ.get("DECORATORS_DISABLED", "") in ("", "0")
+INSTRUMENTED = {}   # raw function -> its wrappers, innermost first
+_RAW = {}           # wrapper -> raw function it was stacked on
+_PENDING = set()    # raw functions decorated with @ while disabled
+_REBOUND = []       # (owner, name, raw, wrapper) swapped out by disable()
+
+
+def _swappable(func):
+    return "<locals>" not in getattr(func, "__qualname__", "<locals>")
+
+
+def _owner(raw):
+    """Return the module or class that defines raw, or None if not (yet) there"""
+    owner = sys.modules.get(getattr(raw, "__module__", None))
+    for attr in raw.__qualname__.split(".")[:-1]:
+        owner = getattr(owner, attr, None)
+    return owner
+
+
+def _bound(raw):
+    owner = _owner(raw)
+    return owner is not None and vars(owner).get(raw.__name__) is raw
+
+
+def _chained(func):
+    """Return what a new wrapper around func should call
+
+    While disabled, an inner @decorator hands back the raw function, so
+    the next one in the stack is given the outermost wrapper so far
+    instead. That way enable() can put the whole stack back.
+    """
+    chain = INSTRUMENTED.get(func)
+    return chain[-1] if chain and func in _PENDING and not ENABLED else func
+
+
+def _instrument(func, wrapper):
+    """Return wrapper, or the raw function while instrumentation is disabled
+
+    Wrappers of module- and class-level functions are remembered per raw
+    function so that enable() and disable() can swap them. Nested
+    functions cannot be rebound and are not remembered, so they are not
+    kept alive.
+    """
+    raw = _RAW.get(func, func)
+    if not _swappable(raw):
+        return wrapper if ENABLED else func
+    INSTRUMENTED.setdefault(raw, []).append(wrapper)
+    _RAW[wrapper] = raw
+    if ENABLED:
+        return wrapper
+    # With @decorator the name is only bound after the last decorator
+    # returns; timed = timer(work) leaves work alone and is not tracked
+    if not _bound(raw):
+        _PENDING.add(raw)
+    return raw
+
+
+def enable():
+    """Put back the wrappers that disable() or import-time disabling left out
+
+    Only names that disable() rebound, and names defined with @decorator
+    while disabled, are changed.
+    """
+    global ENABLED
+    ENABLED = True
+    for owner, name, raw, wrapper in _REBOUND:
+        if vars(owner).get(name) is raw:
+            setattr(owner, name, wrapper)
+    _REBOUND.clear()
+    for raw in _PENDING:
+        owner = _owner(raw)
+        if owner is not None and vars(owner).get(raw.__name__) is raw:
+            setattr(owner, raw.__name__, INSTRUMENTED[raw][-1])
+    _PENDING.clear()
+
+
+def disable():
+    """Rebind module- and class-level names of wrappers to the raw functions
+
+    References held elsewhere keep whatever they were given.
+    """
+    global ENABLED
+    if not ENABLED:
+        return
+    ENABLED = False
+    for raw, chain in INSTRUMENTED.items():
+        owner = _owner(raw)
+        if owner is None:
+            continue
+        for name, value in list(vars(owner).items()):
+            if value is chain[-1]:
+                setattr(owner, name, raw)
+                _REBOUND.append((owner, name, raw, chain[-1]))
+
+
+TIMINGS = dict()
+
+_BUCKETS = 512  # enough for any 64-bit number of nanoseconds
+
+class LatencyHistogram:
+    """Log-linear histogram of call latencies in nanoseconds
+
+    Each power of two is split into 8 buckets, so percentiles are within
+    about 12% of the true value while recording stays a few integer ops.
+    counts and totals are plain lists updated in place, so the timer
+    wrappers can do the recording inline.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.counts = [0] * _BUCKETS
+        self.totals = [0, 0]    # total_ns, max_ns
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    @property
+    def total_ns(self):
+        return self.totals[0]
+
+    @property
+    def max_ns(self):
+        return self.totals[1]
+
+    def record(self, ns):
+        if ns < 16:
+            self.counts[ns] += 1
+        else:
+            shift = ns.bit_length() - 4
+            self.counts[(shift << 3) + (ns >> shift)] += 1
+        self.totals[0] += ns
+        if ns > self.totals[1]:
+            self.totals[1] = ns
+
+    @staticmethod
+    def _bucket_ns(index):
+        """Upper bound of a bucket in nanoseconds"""
+        if index < 16:
+            return index
+        shift, top = divmod(index, 8)
+        return ((top + 9) << (shift - 1)) - 1
+
+    def percentile(self, q, count=None):
+        """Return the latency in ns below which q percent of calls fall"""
+        count = self.count if count is None else count
+        if not count:
+            return 0
+        rank = q / 100 * count
+        seen = 0
+        for index, calls in enumerate(self.counts):
+            seen += calls
+            if calls and seen >= rank:
+                return min(self._bucket_ns(index), self.max_ns)
+        return self.max_ns
+
+    def summary(self):
+        count = self.count
+        return {
+            "count": count,
+            "mean_ns": self.total_ns // count if count else 0,
+            "p50_ns": self.percentile(50, count),
+            "p95_ns": self.percentile(95, count),
+            "p99_ns": self.percentile(99, count),
+            "max_ns": self.max_ns,
+        }
+
+    def reset(self):
+        self.counts[:] = [0] * _BUCKETS
+        self.totals[:] = [0, 0]
+
+    def flush(self, reset=True):
+        """Print and return the summary, or None if nothing was recorded"""
+        if not self.count:
+            return None
+        print(self)
+        summary = self.summary()
+        if reset:
+            self.reset()
+        return summary
+
+    def __str__(self):
+        s = self.summary()
+        return (f"{self.name!r}: {s['count']} calls, "
+                f"p50 {s['p50_ns'] / 1e6:.4f} ms, p95 {s['p95_ns'] / 1e6:.4f} ms, "
+                f"p99 {s['p99_ns'] / 1e6:.4f} ms, max {s['max_ns'] / 1e6:.4f} ms")
+
+
+def flush_timings(reset=True):
+    """Print and return a summary of every aggregated timer"""
+    summaries = {}
+    for name, histogram in TIMINGS.items():
+        summary = histogram.flush(reset)
+        if summary is not None:
+            summaries[name] = summary
+    return summaries
+
+
+def timer(_func=None, *, aggregate=False, flush_interval=None):
+    """Print the runtime of the decorated function
+
+    With aggregate=True nothing is printed per call: runtimes go into a
+    LatencyHistogram in TIMINGS and are printed by flush_timings(). With
+    flush_interval, this function's histogram alone is also printed and
+    reset every flush_interval seconds.
+    """
+    def decorator_timer(func):
+        func = _chained(func)
+        if aggregate:
+            name = f"{func.__module__}.{func.__qualname__}"
+            histogram = TIMINGS.setdefault(name, LatencyHistogram(name))
+            counts, totals = histogram.counts, histogram.totals
+            interval_ns = int(flush_interval * 1e9) if flush_interval else None
+            next_flush = [time.perf_counter_ns() + interval_ns] if interval_ns else None
+            clock = time.perf_counter_ns
+
+            def report(run_ns):
+                histogram.record(run_ns)
+                if next_flush and clock() >= next_flush[0]:
+                    next_flush[0] = clock() + interval_ns
+                    histogram.flush()
+        else:
+            def report(run_ns):
+                print(f"Finished {func.__name__!r} in {run_ns / 1e9:.4f} secs")
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper_timer(*args, **kwargs):
+                start_ns = time.perf_counter_ns()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    report(time.perf_counter_ns() - start_ns)
+        elif inspect.isasyncgenfunction(func):
+            # Time from the first step until the generator is exhausted
+            @functools.wraps(func)
+            async def wrapper_timer(*args, **kwargs):
+                start_ns = time.perf_counter_ns()
+                try:
+                    async for item in func(*args, **kwargs):
+                        yield item
+                finally:
+                    report(time.perf_counter_ns() - start_ns)
+        elif not aggregate:
+            @functools.wraps(func)
+            def wrapper_timer(*args, **kwargs):
+                start_time = time.perf_counter()    # 1
+                value = func(*args, **kwargs)
+                end_time = time.perf_counter()      # 2
+                run_time = end_time - start_time    # 3
+                print(f"Finished {func.__name__!r} in {run_time:.4f} secs")
+                return value
+        elif interval_ns is None:
+            # LatencyHistogram.record() inlined: no calls beyond the clock
+            @functools.wraps(func)
+            def wrapper_timer(*args, **kwargs):
+                start_ns = clock()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    ns = clock() - start_ns
+                    if ns < 16:
+                        counts[ns] += 1
+                    else:
+                        shift = ns.bit_length() - 4
+                        counts[(shift << 3) + (ns >> shift)] += 1
+                    totals[0] += ns
+                    if ns > totals[1]:
+                        totals[1] = ns
+        else:
+            @functools.wraps(func)
+            def wrapper_timer(*args, **kwargs):
+                start_ns = clock()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    end_ns = clock()
+                    ns = end_ns - start_ns
+                    if ns < 16:
+                        counts[ns] += 1
+                    else:
+                        shift = ns.bit_length() - 4
+                        counts[(shift << 3) + (ns >> shift)] += 1
+                    totals[0] += ns
+                    if ns > totals[1]:
+                        totals[1] = ns
+                    if end_ns >= next_flush[0]:
+                        next_flush[0] = end_ns + interval_ns
+                        histogram.flush()
+
+        if aggregate:
+            wrapper_timer.histogram = histogram
+        return _instrument(func, wrapper_timer)
+
+    if _func is None:
+        return decorator_timer
+    else:
+        return decorator_timer(_func)
+
+
+DEBUG_RECORDS = collections.deque(maxlen=1000)
+
+class _ShortRepr(reprlib.Repr):
+    """repr() cut to max_repr characters, without building the whole repr
+
+    Strings, numbers and containers are shortened as reprlib does. Objects
+    with a .shape of more than max_repr elements, such as DataFrames and
+    arrays, are shown as their type and shape. Any other object still has
+    its full repr() built before it is cut.
+    """
+    def __init__(self, max_repr):
+        super().__init__()
+        self.max_repr = max_repr
+        self.maxstring = self.maxlong = self.maxother = max_repr
+
+    def repr_instance(self, obj, level):
+        shape = getattr(obj, "shape", None)
+        if isinstance(shape, tuple) and math.prod(shape) > self.max_repr:
+            return f"<{type(obj).__name__} shape={shape}>"
+        return super().repr_instance(obj, level)
+
+    def __call__(self, obj):
+        text = self.repr(obj)
+        if len(text) > self.max_repr:
+            return text[:self.max_repr] + "..."
+        return text
+
+
+def debug(_func=None, *, sample=1, max_repr=None, buffered=False):
+    """Print the function signature and return value
+
+    Only every sample-th call is traced. With max_repr, each argument and
+    return value is shown in at most max_repr characters, and large
+    objects are summarized instead of rendered (see _ShortRepr). With
+    buffered=True the trace goes into the DEBUG_RECORDS ring buffer
+    instead of stdout. Calls that are not sampled never touch repr() of
+    their arguments.
+    """
+    if sample < 1:
+        raise ValueError(f"sample must be at least 1, got {sample!r}")
+    if max_repr is not None and max_repr < 1:
+        raise ValueError(f"max_repr must be at least 1, got {max_repr!r}")
+
+    def decorator_debug(func):
+        func = _chained(func)
+        is_async = inspect.iscoroutinefunction(func) or inspect.isasyncgenfunction(func)
+        if sample == 1 and max_repr is None and not buffered and not is_async:
+            @functools.wraps(func)
+            def wrapper_debug(*args, **kwargs):
+                args_repr = [repr(a) for a in args]                      # 1
+                kwargs_repr = [f"{k}={v!r}" for k, v in kwargs.items()]  # 2
+                signature = ", ".join(args_repr + kwargs_repr)           # 3
+                print(f"Calling {func.__name__}({signature})")
+                value = func(*args, **kwargs)
+                print(f"{func.__name__!r} returned {value!r}")           # 4
+                return value
+            return _instrument(func, wrapper_debug)
+
+        calls = itertools.count()
+        emit = DEBUG_RECORDS.append if buffered else print
+        short = repr if max_repr is None else _ShortRepr(max_repr)
+
+        def signature(args, kwargs):
+            args_repr = [short(a) for a in args]
+            kwargs_repr = [f"{k}={short(v)}" for k, v in kwargs.items()]
+            return ", ".join(args_repr + kwargs_repr)
+
+        # Same lines as the plain wrapper above, for sampled calls only
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper_debug(*args, **kwargs):
+                if next(calls) % sample:
+                    return await func(*args, **kwargs)
+                emit(f"Calling {func.__name__}({signature(args, kwargs)})")
+                value = await func(*args, **kwargs)
+                emit(f"{func.__name__!r} returned {short(value)}")
+                return value
+        elif inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def wrapper_debug(*args, **kwargs):
+                traced = not next(calls) % sample
+                if traced:
+                    emit(f"Calling {func.__name__}({signature(args, kwargs)})")
+                async for item in func(*args, **kwargs):
+                    if traced:
+                        emit(f"{func.__name__!r} yielded {short(item)}")
+                    yield item
+        else:
+            @functools.wraps(func)
+            def wrapper_debug(*args, **kwargs):
+                if next(calls) % sample:
+                    return func(*args, **kwargs)
+                emit(f"Calling {func.__name__}({signature(args, kwargs)})")
+                value = func(*args, **kwargs)
+                emit(f"{func.__name__!r} returned {short(value)}")
+                return value
+        return _instrument(func, wrapper_debug)
+
+    if _func is None:
+        return decorator_debug
+    else:
+        return decorator_debug(_func)
+
+
+TRACE_SPANS = collections.deque(maxlen=1_000_000)
+_span_ids = itertools.count(1)
+_current_span = contextvars.ContextVar("current_span", default=0)
+
+def _fingerprint(args, kwargs):
+    try:
+        value = hash((args, tuple(kwargs.items())))
+    except TypeError:
+        value = hash(tuple(type(a).__name__ for a in args) + tuple(kwargs))
+    return value & 0xFFFFFFFF
+
+
+def trace(func):
+    """Record a span for every call of the decorated function
+
+    A span is (span_id, parent_id, qualname, start_ns, end_ns, thread_id,
+    argument fingerprint), appended to TRACE_SPANS. Appending to a deque
+    needs no lock, and the parent comes from a context variable so nesting
+    is right across threads and asyncio tasks.
+    """
+    func = _chained(func)
+    name = func.__qualname__
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper_trace(*args, **kwargs):
+            span_id = next(_span_ids)
+            token = _current_span.set(span_id)
+            start_ns = time.perf_counter_ns()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                end_ns = time.perf_counter_ns()
+                _current_span.reset(token)
+                TRACE_SPANS.append((span_id, _current_span.get(), name, start_ns, end_ns,
+                                    threading.get_ident(), _fingerprint(args, kwargs)))
+    elif inspect.isasyncgenfunction(func):
+        # The span lasts until the generator is exhausted or closed. It is
+        # only the current span while the generator runs, not while the
+        # caller handles a yielded item
+        @functools.wraps(func)
+        async def wrapper_trace(*args, **kwargs):
+            span_id = next(_span_ids)
+            parent_id = _current_span.get()
+            start_ns = time.perf_counter_ns()
+            generator = func(*args, **kwargs)
+            try:
+                while True:
+                    token = _current_span.set(span_id)
+                    try:
+                        item = await generator.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        _current_span.reset(token)
+                    yield item
+            finally:
+                await generator.aclose()
+                TRACE_SPANS.append((span_id, parent_id, name, start_ns, time.perf_counter_ns(),
+                                    threading.get_ident(), _fingerprint(args, kwargs)))
+    else:
+        @functools.wraps(func)
+        def wrapper_trace(*args, **kwargs):
+            span_id = next(_span_ids)
+            token = _current_span.set(span_id)
+            start_ns = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end_ns = time.perf_counter_ns()
+                _current_span.reset(token)
+                TRACE_SPANS.append((span_id, _current_span.get(), name, start_ns, end_ns,
+                                    threading.get_ident(), _fingerprint(args, kwargs)))
+    return _instrument(func, wrapper_trace)
+
+
+def export_chrome_trace(path, spans=None):
+    """Write spans as Chrome trace-event JSON, for chrome://tracing or Perfetto"""
+    spans = list(TRACE_SPANS if spans is None else spans)
+    pid = os.getpid()
+    events = [
+        {"name": name, "ph": "X", "ts": start_ns / 1000, "dur": (end_ns - start_ns) / 1000,
+         "pid": pid, "tid": thread_id,
+         "args": {"span": span_id, "parent": parent_id, "fingerprint": fingerprint}}
+        for span_id, parent_id, name, start_ns, end_ns, thread_id, fingerprint in spans
+    ]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ns"}, f)
+
+
+_TRACE_MAGIC = b"PYTRACE1"
+_SPAN_STRUCT = struct.Struct("<QQIqqQI")
+
+def export_binary_trace(path, spans=None):
+    """Write spans to a compact binary file, see read_binary_trace()
+
+    Layout: magic, name count, length-prefixed UTF-8 names, span count and
+    one fixed-size record per span with the name stored as an index.
+    """
+    spans = list(TRACE_SPANS if spans is None else spans)
+    names = {}
+    for span in spans:
+        names.setdefault(span[2], len(names))
+    with open(path, "wb") as f:
+        f.write(_TRACE_MAGIC)
+        f.write(struct.pack("<I", len(names)))
+        for name in names:
+            encoded = name.encode()
+            f.write(struct.pack("<H", len(encoded)) + encoded)
+        f.write(struct.pack("<Q", len(spans)))
+        for span_id, parent_id, name, start_ns, end_ns, thread_id, fingerprint in spans:
+            f.write(_SPAN_STRUCT.pack(span_id, parent_id, names[name], start_ns, end_ns,
+                                      thread_id, fingerprint))
+
+
+def read_binary_trace(path):
+    """Load the spans written by export_binary_trace()"""
+    with open(path, "rb") as f:
+        if f.read(len(_TRACE_MAGIC)) != _TRACE_MAGIC:
+            raise ValueError(f"{path} is not a binary trace file")
+        (num_names,) = struct.unpack("<I", f.read(4))
+        names = []
+        for _ in range(num_names):
+            (length,) = struct.unpack("<H", f.read(2))
+            names.append(f.read(length).decode())
+        (num_spans,) = struct.unpack("<Q", f.read(8))
+        data = f.read(num_spans * _SPAN_STRUCT.size)
+    return [(span_id, parent_id, names[name], start_ns, end_ns, thread_id, fingerprint)
+            for span_id, parent_id, name, start_ns, end_ns, thread_id, fingerprint
+            in _SPAN_STRUCT.iter_unpack(data)]
+
+
+class CallCounter:
+    """Call count kept in one shard per thread and summed on read
+
+    Each thread only ever increments its own shard, so counting needs no
+    lock and loses no updates. The lock is taken once per new thread and
+    on reads.
+    """
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._offsets = []
+        self._lock = threading.Lock()
+
+    def shard(self):
+        """Return the calling thread's shard, a one-element list"""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = [0]
+            with self._lock:
+                self._shards.append((threading.current_thread().name, shard))
+                self._offsets.append(0)
+            return shard
+
+    def snapshot(self):
+        """Return calls per thread name since the last reset"""
+        calls = collections.defaultdict(int)
+        with self._lock:
+            for (name, shard), offset in zip(self._shards, self._offsets):
+                calls[name] += shard[0] - offset
+        return dict(calls)
+
+    @property
+    def value(self):
+        return sum(self.snapshot().values())
+
+    def reset(self):
+        with self._lock:
+            self._offsets = [shard[0] for _, shard in self._shards]
+
+
+def count_calls(func):
+    """Count the calls to the decorated function in .counter"""
+    func = _chained(func)
+    counter = CallCounter()
+    local = counter._local
+    new_shard = counter.shard
 
-def debug(func):
-    """Print the function signature and return value"""
     @functools.wraps(func)
-    def wrapper_debug(*args, **kwargs):
-        args_repr = [repr(a) for a in args]                      # 1
-        kwargs_repr = [f"{k}={v!r}" for k, v in kwargs.items()]  # 2
-        signature = ", ".join(args_repr + kwargs_repr)           # 3
-        print(f"Calling {func.__name__}({signature})")
-        value = func(*args, **kwargs)
-        print(f"{func.__name__!r} returned {value!r}")           # 4
-        return value
-    return wrapper_debug
+    def wrapper_count_calls(*args, **kwargs):
+        try:
+            shard = local.shard
+        except AttributeError:
+            shard = new_shard()
+        shard[0] += 1
+        return func(*args, **kwargs)
+    wrapper_count_calls.counter = counter
+    return _instrument(func, wrapper_count_calls)
+
+
+class CountCalls:
+    """Class version of count_calls that also exposes .num_calls"""
+    def __init__(self, func):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.counter = CallCounter()
+
+    def __call__(self, *args, **kwargs):
+        self.counter.shard()[0] += 1
+        return self.func(*args, **kwargs)
+
+    @property
+    def num_calls(self):
+        return self.counter.value
+
+
+class _LazyPlugin:
+    """Stand-in for a plug-in that is imported on first use"""
+    def __init__(self, target):
+        self.module, _, self.attr = target.partition(":")
+        if not self.module or not self.attr:
+            raise ValueError(f"Plug-in target must look like 'module:function', got {target!r}")
+
+    def load(self):
+        obj = importlib.import_module(self.module)
+        for attr in self.attr.split("."):
+            obj = getattr(obj, attr)
+        return obj
+
+
+class _PluginGroup:
+    def __init__(self):
+        self.names = []
+        self.funcs = []
+        self.weights = []
+        self.index = {}
+        self.alias = None
+
+    def add(self, name, func, weight):
+        if name in self.index:
+            i = self.index[name]
+            self.funcs[i], self.weights[i] = func, weight
+        else:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+            self.funcs.append(func)
+            self.weights.append(weight)
+        self.alias = None
+
+    def remove(self, name):
+        # Move the last plugin into the freed slot so removal is O(1)
+        i = self.index.pop(name)
+        last_name, last_func, last_weight = self.names.pop(), self.funcs.pop(), self.weights.pop()
+        if i < len(self.names):
+            self.names[i], self.funcs[i], self.weights[i] = last_name, last_func, last_weight
+            self.index[last_name] = i
+        self.alias = None
+
+    def resolve(self, i):
+        func = self.funcs[i]
+        if isinstance(func, _LazyPlugin):
+            func = self.funcs[i] = func.load()
+        return func
+
+    def build_alias(self):
+        """Build Walker's alias table for O(1) weighted choice"""
+        n = len(self.weights)
+        total = sum(self.weights)
+        scaled = [w * n / total for w in self.weights]
+        prob, alias = [1.0] * n, list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s], alias[s] = scaled[s], l
+            scaled[l] -= 1 - scaled[s]
+            (small if scaled[l] < 1 else large).append(l)
+        self.alias = prob, alias
+
+
+class PluginRegistry:
+    """Plug-in functions by name, in groups, with O(1) random selection
+
+    Each group keeps its names and functions in flat lists that are
+    updated in place on register/unregister, so choice() never rebuilds
+    them. Weighted choice uses an alias table that is rebuilt lazily only
+    after the group changed.
+    """
+    def __init__(self, rng=None):
+        self._groups = collections.defaultdict(_PluginGroup)
+        self._random = rng or random.Random()
+
+    def register(self, _func=None, *, name=None, group="default", weight=1.0):
+        """Register a function as a plug-in"""
+        if weight <= 0:
+            raise ValueError(f"Plug-in weight must be positive, got {weight}")
+
+        def decorator_register(func):
+            self._groups[group].add(name or func.__name__, func, weight)
+            return func
+
+        if _func is None:
+            return decorator_register
+        else:
+            return decorator_register(_func)
+
+    def load_manifest(self, manifest, group="default"):
+        """Register plug-ins from a manifest without importing them
+
+        manifest maps names to "module:function" targets, or to
+        {"target": ..., "weight": ...}, and may be a path to a JSON file.
+        Each module is imported the first time one of its plug-ins is
+        picked or looked up.
+        """
+        if not isinstance(manifest, dict):
+            with open(manifest) as f:
+                manifest = json.load(f)
+        plugins = self._groups[group]
+        for name, entry in manifest.items():
+            if isinstance(entry, str):
+                entry = {"target": entry}
+            plugins.add(name, _LazyPlugin(entry["target"]), entry.get("weight", 1.0))
+
+    def unregister(self, name, group="default"):
+        self._groups[group].remove(name)
+
+    def get(self, name, group="default"):
+        plugins = self._groups.get(group)
+        if plugins is None or name not in plugins.index:
+            raise KeyError(f"No plug-in {name!r} in group {group!r}")
+        return plugins.resolve(plugins.index[name])
+
+    def items(self, group="default"):
+        """Return the (name, function) pairs of a group, importing lazy ones"""
+        plugins = self._groups.get(group) or _PluginGroup()
+        return [(name, plugins.resolve(i)) for i, name in enumerate(plugins.names)]
+
+    def groups(self):
+        return [group for group, plugins in self._groups.items() if plugins.names]
+
+    def __len__(self):
+        return sum(len(plugins.names) for plugins in self._groups.values())
+
+    def _nonempty(self, group):
+        plugins = self._groups.get(group)
+        if not plugins or not plugins.names:
+            raise LookupError(f"No plug-ins registered in group {group!r}")
+        return plugins
+
+    def choice(self, group="default"):
+        """Return a uniformly random (name, function) pair"""
+        plugins = self._nonempty(group)
+        i = int(self._random.random() * len(plugins.names))
+        return plugins.names[i], plugins.resolve(i)
+
+    def weighted_choice(self, group="default"):
+        """Return a (name, function) pair picked in proportion to its weight"""
+        plugins = self._nonempty(group)
+        if plugins.alias is None:
+            plugins.build_alias()
+        prob, alias = plugins.alias
+        u = self._random.random() * len(prob)
+        i = int(u)
+        if u - i >= prob[i]:
+            i = alias[i]
+        return plugins.names[i], plugins.resolve(i)
+
+
+_KWARGS_MARK = object()
+
+def cache(_func=None, *, maxsize=128, ttl=None, thread_safe=False):
+    """Keep a cache of previous function calls
+
+    At most maxsize results are kept, evicting the least recently used.
+    With ttl, an entry older than ttl seconds counts as a miss. Pass
+    thread_safe=True when the function is called from several threads.
+    """
+    def decorator_cache(func):
+        entries = collections.OrderedDict()
+        stats = {"hits": 0, "misses": 0, "evictions": 0}
+        lock = threading.Lock() if thread_safe else contextlib.nullcontext()
+
+        @functools.wraps(func)
+        def wrapper_cache(*args, **kwargs):
+            key = args + (_KWARGS_MARK,) + tuple(kwargs.items()) if kwargs else args
+            with lock:
+                entry = entries.get(key)
+                if entry is not None and (ttl is None or time.monotonic() < entry[1]):
+                    entries.move_to_end(key)
+                    stats["hits"] += 1
+                    return entry[0]
+                stats["misses"] += 1
+            value = func(*args, **kwargs)
+            expires = time.monotonic() + ttl if ttl is not None else None
+            with lock:
+                entries[key] = (value, expires)
+                entries.move_to_end(key)
+                while len(entries) > maxsize:
+                    entries.popitem(last=False)
+                    stats["evictions"] += 1
+            return value
+
+        def cache_info():
+            with lock:
+                return dict(stats, size=len(entries), maxsize=maxsize)
+
+        def cache_clear():
+            with lock:
+                entries.clear()
+                stats.update(hits=0, misses=0, evictions=0)
+
+        wrapper_cache.cache_info = cache_info
+        wrapper_cache.cache_clear = cache_clear
+        return wrapper_cache
 
+    if _func is None:
+        return decorator_cache
+    else:
+        return decorator_cache(_func)
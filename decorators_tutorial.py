@@ -489,6 +489,30 @@ globals()
 #Using the @register decorator, you can create your own curated list of interesting variables, 
 # effectively hand-picking some functions from globals().
 
+#Note that randomly_greet() builds list(PLUGINS.items()) on every call. When plug-ins are
+# dispatched often, the PluginRegistry in decorators.py keeps that list up to date as plug-ins
+# register, so picking one costs the same however many there are. It also supports groups and
+# weights:
+
+from decorators import PluginRegistry
+
+greeters = PluginRegistry()
+
+@greeters.register
+def say_hello(name):
+    return f"Hello {name}"
+
+@greeters.register(weight=3)
+def be_awesome(name):
+    return f"Yo {name}, together we are the awesomest!"
+
+def randomly_greet(name):
+    greeter, greeter_func = greeters.weighted_choice()
+    print(f"Using {greeter!r}")
+    return greeter_func(name)
+
+randomly_greet("Alice")
+
 #Fancy Decorators
 '''
 In the second part of this tutorial, we’ll explore more advanced features, including how to use 
@@ -809,3 +833,24 @@ say_whee()
 
 say_whee.num_calls
 
+
+#Caching Return Values
+#Decorators can provide a nice mechanism for caching and memoization. The @cache decorator in
+# decorators.py keeps the results of previous calls, keyed by their arguments. It holds at most
+# maxsize results, throwing out the least recently used one first, and can let entries expire
+# after ttl seconds:
+
+import math
+from decorators import cache
+
+math.factorial = cache(math.factorial, maxsize=32)
+
+def approximate_e(terms=18):
+    return sum(1 / math.factorial(n) for n in range(terms))
+
+approximate_e()
+approximate_e()
+
+#The second call is answered entirely from the cache, which you can check with .cache_info():
+
+math.factorial.cache_info()
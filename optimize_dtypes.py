@@ -0,0 +1,114 @@
+### Load CSVs with compact dtypes picked automatically
+
+'''
+Panda Tricks.ipynb shows by hand that colors.astype('category') is much
+smaller once a column has few distinct values, and the Groupby tutorial
+hardcodes a dtypes dict for legislators-historical.csv. load_csv() picks
+the dtypes itself:
+
+- text columns with few distinct values in a sample become category
+- integers get the smallest int/uint type that holds their range, or a
+  nullable Int type if they have missing values
+- floats become float32 only when every value survives the round trip
+  exactly, so the data is never changed
+
+It returns the frame with a before/after memory_usage(deep=True) report
+and saves the chosen dtypes as JSON. Later loads read that schema and
+pass it straight to read_csv, so the wide default types are never built.
+'''
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+_INT_TYPES = [np.int8, np.uint8, np.int16, np.uint16, np.int32, np.uint32, np.int64, np.uint64]
+
+
+def _smallest_int(low, high, nullable):
+    for int_type in _INT_TYPES:
+        info = np.iinfo(int_type)
+        if info.min <= low and high <= info.max:
+            name = np.dtype(int_type).name
+            return name.capitalize().replace("Uint", "UInt") if nullable else name
+    return "Int64" if nullable else "int64"
+
+
+def infer_dtype(column, sample_rows=10_000, max_category_ratio=0.5):
+    """Return the most compact dtype name for column, or None to keep it"""
+    values = column.dropna()
+    if values.empty:
+        return None
+    kind = column.dtype.kind
+    if kind == "O" or isinstance(column.dtype, pd.StringDtype):
+        sample = values.sample(min(len(values), sample_rows), random_state=0)
+        if sample.nunique() <= max_category_ratio * len(sample):
+            return "category"
+        return None
+    if kind in "iu":
+        return _smallest_int(values.min(), values.max(), nullable=False)
+    if kind == "f":
+        if (values == np.floor(values)).all() and np.abs(values).max() < 2 ** 53:
+            return _smallest_int(int(values.min()), int(values.max()),
+                                 nullable=column.isna().any())
+        # Only when no value changes: 0.586 is not exactly a float32
+        array = values.to_numpy(dtype=np.float64)
+        with np.errstate(over="ignore"):
+            if (array.astype(np.float32).astype(np.float64) == array).all():
+                return "float32"
+    return None
+
+
+def infer_dtypes(df, sample_rows=10_000, max_category_ratio=0.5):
+    """Return {column: dtype} for the columns that can be made smaller"""
+    dtypes = {}
+    for name in df.columns:
+        dtype = infer_dtype(df[name], sample_rows, max_category_ratio)
+        if dtype is not None and dtype != df[name].dtype.name:
+            dtypes[name] = dtype
+    return dtypes
+
+
+def memory_report(before, after):
+    """Return deep memory usage per column of two versions of a frame"""
+    report = pd.DataFrame({
+        "before_dtype": before.dtypes.astype(str) if before is not None else None,
+        "after_dtype": after.dtypes.astype(str),
+        "before_bytes": before.memory_usage(index=False, deep=True) if before is not None else np.nan,
+        "after_bytes": after.memory_usage(index=False, deep=True),
+    }, index=after.columns)
+    report.loc["total"] = [None, None, report["before_bytes"].sum(min_count=1),
+                           report["after_bytes"].sum()]
+    report["ratio"] = report["after_bytes"] / report["before_bytes"]
+    return report
+
+
+def load_csv(path, schema_path=None, sample_rows=10_000, max_category_ratio=0.5,
+             **read_csv_kwargs):
+    """Read a CSV with compact dtypes, returning (df, memory report)
+
+    The schema is saved to schema_path (path + ".schema.json" by default).
+    If that file exists it is used as is, and the report only has the
+    "after" side. Delete it to pick the dtypes again.
+    """
+    schema_path = schema_path or f"{path}.schema.json"
+    if os.path.exists(schema_path):
+        with open(schema_path) as f:
+            schema = json.load(f)
+        df = pd.read_csv(path, dtype=schema["dtypes"], **read_csv_kwargs)
+        return df, memory_report(None, df)
+
+    before = pd.read_csv(path, **read_csv_kwargs)
+    dtypes = infer_dtypes(before, sample_rows, max_category_ratio)
+    df = before.astype(dtypes)
+    with open(schema_path, "w") as f:
+        json.dump({"dtypes": dtypes}, f, indent=2)
+    return df, memory_report(before, df)
+
+
+if __name__ == "__main__":
+    import sys
+    df, report = load_csv(sys.argv[1] if len(sys.argv) > 1
+                          else os.path.join("groupby-data", "legislators-historical.csv"))
+    print(report)
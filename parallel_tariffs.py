@@ -0,0 +1,132 @@
+### Multi-core tariff costs for large or many demand profiles
+
+'''
+Even apply_tariff_digitize() only uses one core. Two ways to spread the
+work over a process pool:
+
+parallel_cost(df)
+    One big frame. Its timestamps and energy_kwh go into
+    multiprocessing.shared_memory blocks once. Each worker attaches to
+    them by name, costs its own slice and writes into a shared output
+    block, so no column is ever pickled.
+
+parallel_cost_files(paths)
+    A directory of per-meter CSVs. Each worker reads, parses and costs
+    whole files and sends back only the per-meter totals.
+'''
+
+import concurrent.futures
+import contextlib
+import glob
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from tariffs import DEFAULT_TARIFF
+from timestamps import DEMAND_PROFILE, parse_timestamps
+
+
+@contextlib.contextmanager
+def shared_arrays(sources, outputs=()):
+    """Copy equal-length arrays into new shared memory blocks
+
+    Also adds an empty block for each dtype in outputs. Yields the
+    (name, dtype) of every block, to pass to attached_arrays(), and
+    unlinks the blocks on exit.
+    """
+    rows = len(sources[0])
+    dtypes = [source.dtype for source in sources] + [np.dtype(dtype) for dtype in outputs]
+    blocks = [shared_memory.SharedMemory(create=True, size=max(rows * dtype.itemsize, 1))
+              for dtype in dtypes]
+    try:
+        for source, block in zip(sources, blocks):
+            np.ndarray(rows, dtype=source.dtype, buffer=block.buf)[:] = source
+        yield [(block.name, dtype) for block, dtype in zip(blocks, dtypes)]
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+@contextlib.contextmanager
+def attached_arrays(blocks, rows):
+    """Yield a list of arrays over the shared_arrays() blocks
+
+    The list is emptied on exit so the blocks can be closed; do not keep
+    the arrays themselves past the with block.
+    """
+    # Pool workers share the parent's resource tracker, so attaching here
+    # does not make the block go away when a worker exits
+    shared = [shared_memory.SharedMemory(name=name) for name, _ in blocks]
+    arrays = [np.ndarray(rows, dtype=dtype, buffer=block.buf)
+              for (_, dtype), block in zip(blocks, shared)]
+    try:
+        yield arrays
+    finally:
+        arrays.clear()
+        for block in shared:
+            block.close()
+
+
+def _cost_slice(blocks, rows, start, stop, schedule):
+    with attached_arrays(blocks, rows) as arrays:
+        times, energy, cost = (array[start:stop] for array in arrays)
+        cost[:] = schedule.cost(times, energy)
+        del times, energy, cost
+    return stop - start
+
+
+def parallel_cost(df, schedule=DEFAULT_TARIFF, workers=None, partitions=None,
+                  time_column=None):
+    """Return cost_cents for df computed by a pool of processes
+
+    Timestamps come from time_column, or from the index when it is None.
+    The frame is cut into partitions contiguous slices (4 per worker by
+    default) so that a slow worker does not hold up the rest.
+    """
+    workers = workers or os.cpu_count()
+    partitions = partitions or 4 * workers
+    rows = len(df)
+    times = pd.DatetimeIndex(df.index if time_column is None else df[time_column])
+    if times.tz is not None:
+        times = times.tz_localize(None)
+    sources = [times.values.astype("M8[ns]"), df["energy_kwh"].values.astype("f8")]
+
+    with shared_arrays(sources, outputs=["f8"]) as blocks:
+        bounds = np.linspace(0, rows, partitions + 1).astype(int)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_cost_slice, blocks, rows, start, stop, schedule)
+                       for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+            for future in futures:
+                future.result()
+        with attached_arrays(blocks[2:], rows) as arrays:
+            cost = arrays[0].copy()
+    return pd.Series(cost, index=df.index, name="cost_cents")
+
+
+def _cost_file(path, schedule):
+    raw = pd.read_csv(path, usecols=["date_time", "energy_kwh"])
+    times = parse_timestamps(raw["date_time"], DEMAND_PROFILE)
+    energy = raw["energy_kwh"].values.astype("f8")
+    return {
+        "meter": os.path.splitext(os.path.basename(path))[0],
+        "rows": len(raw),
+        "energy_kwh": energy.sum(),
+        "cost_cents": schedule.cost(times, energy).sum(),
+    }
+
+
+def parallel_cost_files(paths, schedule=DEFAULT_TARIFF, workers=None):
+    """Return per-meter totals for many demand profile CSVs
+
+    paths is a list of CSV files or a directory of them. The meter name
+    is the file name without extension.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = sorted(glob.glob(os.path.join(paths, "*.csv")))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        totals = list(pool.map(_cost_file, paths, [schedule] * len(paths), chunksize=4))
+    return pd.DataFrame(totals, columns=["meter", "rows", "energy_kwh", "cost_cents"]
+                        ).set_index("meter")
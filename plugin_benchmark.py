@@ -0,0 +1,83 @@
+"""Compare start-up time of eager plug-in imports with a lazy manifest
+
+Generates a package of plug-in modules in a temporary directory, then
+times, each in a fresh interpreter:
+
+eager:  import every module so its @register runs, then dispatch once
+lazy:   load the name -> "module:function" manifest, then dispatch once
+
+Usage: python plugin_benchmark.py [num_plugins] [repeats]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PLUGIN_MODULE = '''\
+import decimal, fractions, statistics  # stand-in for real plug-in dependencies
+from registry import registry
+
+TABLE = [i ** 2 for i in range(2000)]
+
+@registry.register
+def plugin_{i}(name):
+    return f"plugin {i} greets {{name}}"
+'''
+
+EAGER = '''
+import time
+start = time.perf_counter()
+from registry import registry
+{imports}
+registry.get("plugin_0")("Alice")
+print(time.perf_counter() - start)
+'''
+
+LAZY = '''
+import time
+start = time.perf_counter()
+from registry import registry
+registry.load_manifest("manifest.json")
+registry.get("plugin_0")("Alice")
+print(time.perf_counter() - start)
+'''
+
+
+def make_plugins(directory, num_plugins):
+    with open(os.path.join(directory, "registry.py"), "w") as f:
+        f.write("from decorators import PluginRegistry\nregistry = PluginRegistry()\n")
+    manifest = {}
+    for i in range(num_plugins):
+        with open(os.path.join(directory, f"plugin_{i}.py"), "w") as f:
+            f.write(PLUGIN_MODULE.format(i=i))
+        manifest[f"plugin_{i}"] = f"plugin_{i}:plugin_{i}"
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+
+def run(directory, code):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([directory, BASE_DIR]))
+    out = subprocess.run([sys.executable, "-c", textwrap.dedent(code)], cwd=directory,
+                         env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout)
+
+
+def main(num_plugins=300, repeats=5):
+    with tempfile.TemporaryDirectory() as directory:
+        make_plugins(directory, num_plugins)
+        imports = "\n".join(f"import plugin_{i}" for i in range(num_plugins))
+        run(directory, EAGER.format(imports=imports))  # warm the bytecode cache
+        eager = min(run(directory, EAGER.format(imports=imports)) for _ in range(repeats))
+        lazy = min(run(directory, LAZY) for _ in range(repeats))
+    print(f"{num_plugins} plug-ins, best of {repeats}")
+    print(f"eager imports:  {eager * 1000:8.2f} ms")
+    print(f"lazy manifest:  {lazy * 1000:8.2f} ms  ({eager / lazy:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:3]))
@@ -0,0 +1,113 @@
+### Processed demand profiles, cached in an HDFStore
+
+'''
+The "Prevent Reprocessing with HDFStore" section of speed_up_pandas.ipynb
+writes processed_data.h5 by hand and never notices when
+demand_profile.csv changes. load_profile() keeps a fingerprint of the CSV
+and of the processing next to the frame and does the least work it can:
+
+- CSV unchanged (same size and mtime), same processing: read the store.
+- CSV only grew and the part already processed is unchanged: process the
+  new rows and append them to the store.
+- Anything else: process the whole CSV again.
+
+Checking whether the old part is unchanged hashes its first and last
+64 KiB rather than the whole file. That is enough to catch edits and
+rewrites of an append-only log without reading it all.
+'''
+
+import hashlib
+import io
+import os
+
+import pandas as pd
+
+from tariffs import DEFAULT_TARIFF, apply_tariff_schedule
+from timestamps import DEMAND_PROFILE, parse_timestamps
+
+# Bump when process_profile() changes what it produces
+PROCESSING_VERSION = 1
+
+_SAMPLE_BYTES = 64 * 1024
+
+
+def process_profile(raw, schedule=DEFAULT_TARIFF):
+    """Turn raw date_time/energy_kwh rows into the costed, time-indexed frame"""
+    df = pd.DataFrame({"energy_kwh": raw["energy_kwh"].astype("float64").values},
+                      index=parse_timestamps(raw["date_time"], DEMAND_PROFILE))
+    df.index.name = "date_time"
+    return apply_tariff_schedule(df, schedule)
+
+
+def _sample_hash(path, size):
+    """Hash the first and last 64 KiB of the first size bytes of path"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        digest.update(f.read(min(size, _SAMPLE_BYTES)))
+        f.seek(max(size - _SAMPLE_BYTES, 0))
+        digest.update(f.read(size - f.tell()))
+    return digest.hexdigest()
+
+
+def _processing_version(schedule):
+    return f"{PROCESSING_VERSION}:{hashlib.sha256(schedule.table.tobytes()).hexdigest()[:16]}"
+
+
+def fingerprint(path, schedule=DEFAULT_TARIFF, stat=None):
+    """Describe path as it was at stat, which defaults to now"""
+    stat = stat or os.stat(path)
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sample_hash": _sample_hash(path, stat.st_size),
+        "version": _processing_version(schedule),
+    }
+
+
+def _ends_with_newline(path, size):
+    with open(path, "rb") as f:
+        f.seek(size - 1)
+        return f.read(1) == b"\n"
+
+
+def load_profile(csv_path="demand_profile.csv", store_path="processed_data.h5",
+                 key="preprocessed_df", schedule=DEFAULT_TARIFF):
+    """Return the processed profile, reprocessing only what changed
+
+    Returns (df, action) where action is "cached", "appended" or
+    "processed".
+    """
+    # Everything below reads only the first stat.st_size bytes, so rows
+    # appended meanwhile are left for the next call rather than lost
+    stat = os.stat(csv_path)
+    version = _processing_version(schedule)
+
+    with pd.HDFStore(store_path) as store:
+        old = None
+        if f"/{key}" in store.keys():
+            storer = store.get_storer(key)
+            old = getattr(storer.attrs, "fingerprint", None)
+            if storer.format_type != "table":
+                old = None
+
+        if old is not None and old["version"] == version:
+            if old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+                return store[key], "cached"
+            if (stat.st_size > old["size"]
+                    and _ends_with_newline(csv_path, old["size"])
+                    and _sample_hash(csv_path, old["size"]) == old["sample_hash"]):
+                with open(csv_path, "rb") as f:
+                    f.seek(old["size"])
+                    new_rows = io.BytesIO(f.read(stat.st_size - old["size"]))
+                raw = pd.read_csv(new_rows, header=None, names=["date_time", "energy_kwh"])
+                if len(raw):
+                    store.append(key, process_profile(raw, schedule))
+                store.get_storer(key).attrs.fingerprint = fingerprint(csv_path, schedule, stat)
+                return store[key], "appended"
+
+        with open(csv_path, "rb") as f:
+            raw = pd.read_csv(io.BytesIO(f.read(stat.st_size)))
+        df = process_profile(raw, schedule)
+        store.put(key, df, format="table")
+        store.get_storer(key).attrs.fingerprint = fingerprint(csv_path, schedule, stat)
+        return df, "processed"
@@ -0,0 +1,135 @@
+"""Benchmark the apply_tariff_* implementations on generated profiles
+
+Replaces the hand-made %%time table in speed_up_pandas.ipynb. For each
+size, an hourly profile with random energy_kwh is generated and every
+method is run on a fresh copy:
+
+- timing: median and interquartile range over --repeats runs
+- memory: peak traced allocation of one extra run under tracemalloc
+- correctness: cost_cents must match apply_tariff_digitize()
+
+The row-by-row methods are skipped above their --limit, where one run
+would take minutes. Results go to a JSON file for comparing runs.
+
+Usage: python tariff_benchmark.py --sizes 1e3 1e4 1e5 1e6 --out tariff_benchmark.json
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import tariffs
+
+METHODS = {
+    "apply_tariff_loop": tariffs.apply_tariff_loop,
+    "apply_tariff_iterrows": tariffs.apply_tariff_iterrows,
+    "apply_tariff_withapply": tariffs.apply_tariff_withapply,
+    "apply_tariff_isin": tariffs.apply_tariff_isin,
+    "apply_tariff_cut": tariffs.apply_tariff_cut,
+    "apply_tariff_digitize": tariffs.apply_tariff_digitize,
+    "apply_tariff_schedule": tariffs.apply_tariff_schedule,
+}
+
+# Largest profile each slow method is run on by default
+ROW_LIMITS = {
+    "apply_tariff_loop": 10_000,
+    "apply_tariff_iterrows": 100_000,
+    "apply_tariff_withapply": 100_000,
+}
+
+
+# Hourly timestamps repeat after this many hours (200 years), so that even
+# 10^8 rows stay below the datetime64[ns] limit in 2262
+CYCLE_HOURS = 200 * 8766
+
+
+def make_profile(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    hours = np.arange(rows, dtype=np.int64)
+    hours %= CYCLE_HOURS
+    hours *= 3_600_000_000_000
+    hours += pd.Timestamp("2013-01-01").value
+    index = pd.DatetimeIndex(hours.view("M8[ns]"), name="date_time")
+    return pd.DataFrame({"energy_kwh": rng.uniform(0, 2, rows).round(3)}, index=index)
+
+
+def time_method(method, df, repeats):
+    timings = []
+    for _ in range(repeats):
+        frame = df.copy()
+        start = time.perf_counter()
+        method(frame)
+        timings.append(time.perf_counter() - start)
+    return timings, frame
+
+
+def peak_memory(method, df):
+    frame = df.copy()
+    tracemalloc.start()
+    try:
+        method(frame)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes, repeats, limits):
+    results = []
+    for rows in sizes:
+        df = make_profile(rows)
+        expected = df.copy()
+        tariffs.apply_tariff_digitize(expected)
+        for name, method in METHODS.items():
+            if rows > limits.get(name, float("inf")):
+                continue
+            timings, frame = time_method(method, df, repeats)
+            q1, _, q3 = statistics.quantiles(timings, n=4) if len(timings) > 1 else timings * 3
+            result = {
+                "method": name,
+                "rows": rows,
+                "repeats": repeats,
+                "median_s": statistics.median(timings),
+                "iqr_s": q3 - q1,
+                "peak_bytes": peak_memory(method, df),
+                "matches": bool(np.allclose(frame["cost_cents"].values,
+                                            expected["cost_cents"].values)),
+            }
+            results.append(result)
+            print(f"{rows:>11,} rows  {name:<24} {result['median_s']:10.5f} s "
+                  f"(IQR {result['iqr_s']:.5f})  peak {result['peak_bytes'] / 2**20:8.1f} MiB"
+                  f"{'' if result['matches'] else '  WRONG RESULT'}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=float, default=[1e3, 1e4, 1e5, 1e6])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--out", default="tariff_benchmark.json")
+    parser.add_argument("--no-limits", action="store_true",
+                        help="run the row-by-row methods at every size")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes]
+    results = run(sizes, args.repeats, {} if args.no_limits else ROW_LIMITS)
+    report = {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    if not all(result["matches"] for result in results):
+        raise SystemExit("Some methods disagree with apply_tariff_digitize()")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+### Time-of-use tariffs for demand profiles
+
+'''
+Generalizes apply_tariff_digitize() from speed_up_pandas.ipynb. There the
+bands are hardcoded:
+
+    prices = np.array([12, 20, 28])
+    bins = np.digitize(df.index.hour.values, bins=[7, 17, 24])
+    df['cost_cents'] = prices[bins] * df['energy_kwh'].values
+
+A TariffSchedule takes the same (bins, prices) pairs per day type and
+season and compiles them once into a NumPy table indexed by
+(season, day type, time-of-day bucket). Costing a frame is then a handful
+of array lookups, whatever the number of bands.
+'''
+
+import numpy as np
+import pandas as pd
+
+DAY_TYPES = ("weekday", "weekend", "holiday")
+
+# A missing day type falls back to the next one in this chain
+_FALLBACK = {"holiday": "weekend", "weekend": "weekday"}
+
+
+class TariffSchedule:
+    """Time-of-use rates compiled into a NumPy lookup table
+
+    rates maps a day type ("weekday", "weekend", "holiday"), or a
+    (season, day type) tuple when seasons are given, to (bins, prices) as
+    used with np.digitize(): bins are the hours at which each band ends,
+    e.g. ([7, 17, 24], [12, 20, 28]). Band edges may fall inside an hour,
+    as long as they line up with bucket_minutes.
+
+    seasons maps a season name to its months (1-12), holidays is a list
+    of dates charged at the holiday rate.
+    """
+    def __init__(self, rates, seasons=None, holidays=(), bucket_minutes=60):
+        if 1440 % bucket_minutes:
+            raise ValueError(f"bucket_minutes must divide a day, got {bucket_minutes}")
+        self.bucket_minutes = bucket_minutes
+        self.seasons = list(seasons) if seasons else [None]
+        self.holidays = np.unique(
+            np.array(pd.to_datetime(list(holidays)).values, dtype="datetime64[D]"))
+
+        self.season_of_month = np.full(12, -1, dtype=np.intp)
+        if seasons:
+            for i, months in enumerate(seasons.values()):
+                for month in months:
+                    if self.season_of_month[month - 1] != -1:
+                        raise ValueError(f"Month {month} is in more than one season")
+                    self.season_of_month[month - 1] = i
+            if (self.season_of_month == -1).any():
+                missing = [m + 1 for m in np.flatnonzero(self.season_of_month == -1)]
+                raise ValueError(f"Months {missing} are not in any season")
+        else:
+            self.season_of_month[:] = 0
+
+        slot_hours = np.arange(1440 // bucket_minutes) * bucket_minutes / 60
+        self.table = np.empty((len(self.seasons), len(DAY_TYPES), len(slot_hours)))
+        for s, season in enumerate(self.seasons):
+            for d, day_type in enumerate(DAY_TYPES):
+                bins, prices = self._lookup(rates, season, day_type)
+                bins, prices = np.asarray(bins, dtype=float), np.asarray(prices, dtype=float)
+                if len(bins) != len(prices) or bins[-1] < 24:
+                    raise ValueError(f"Bands for {season!r}/{day_type!r} must give one "
+                                     f"price per bin and end at hour 24")
+                edges = bins * 60
+                if np.any(edges % bucket_minutes):
+                    raise ValueError(f"Band edges {list(bins)} do not line up with "
+                                     f"{bucket_minutes}-minute buckets")
+                self.table[s, d] = prices[np.digitize(slot_hours, bins)]
+
+    @staticmethod
+    def _lookup(rates, season, day_type):
+        while True:
+            key = day_type if season is None else (season, day_type)
+            if key in rates:
+                return rates[key]
+            if day_type not in _FALLBACK:
+                raise KeyError(f"No rates for {key!r}")
+            day_type = _FALLBACK[day_type]
+
+    def rates_for(self, times):
+        """Return the rate in effect at each timestamp, as a float array"""
+        times = pd.DatetimeIndex(times)
+        if times.tz is not None:
+            times = times.tz_localize(None)
+        # Integer arithmetic on the raw datetime64 values is much cheaper
+        # than going through the .hour/.dayofweek/.month accessors
+        minutes = times.values.astype("datetime64[m]").view("int64")
+        days, minute_of_day = np.divmod(minutes, 1440)
+        slot = minute_of_day // self.bucket_minutes
+        if (self.table == self.table[0, 0]).all():
+            # Same bands every day of the year, as in the notebook
+            return self.table[0, 0][slot]
+        # 1970-01-01 was a Thursday, so shifting by 3 makes Monday 0
+        day_type = ((days + 3) % 7 >= 5).astype(np.intp)
+        if len(self.holidays):
+            day_type[np.isin(days, self.holidays.view("int64"))] = 2
+        month = times.values.astype("datetime64[M]").view("int64") % 12
+        return self.table[self.season_of_month[month], day_type, slot]
+
+    def cost(self, times, energy_kwh):
+        """Return cost per interval for energy used at the given times"""
+        return self.rates_for(times) * np.asarray(energy_kwh)
+
+
+# The three bands used throughout speed_up_pandas.ipynb
+DEFAULT_TARIFF = TariffSchedule({"weekday": ([7, 17, 24], [12, 20, 28])})
+
+
+def apply_tariff_schedule(df, schedule=DEFAULT_TARIFF, time_column=None):
+    """Calculate costs with a compiled schedule.  Modifies `df` inplace.
+
+    Timestamps come from time_column, or from the index when it is None,
+    as in the notebook after df.set_index('date_time').
+    """
+    times = df.index if time_column is None else df[time_column]
+    df['cost_cents'] = schedule.cost(times, df['energy_kwh'].values)
+    return df
+
+
+# The versions from speed_up_pandas.ipynb, slowest first. All take a frame
+# indexed by date_time, as after df.set_index('date_time'), and set
+# df['cost_cents'].
+
+def apply_tariff(kwh, hour):
+    """Calculates cost of electricity for given hour."""
+    if 0 <= hour < 7:
+        rate = 12
+    elif 7 <= hour < 17:
+        rate = 20
+    elif 17 <= hour < 24:
+        rate = 28
+    else:
+        raise ValueError(f'Invalid hour: {hour}')
+    return rate * kwh
+
+
+def apply_tariff_loop(df):
+    """Calculate costs in loop.  Modifies `df` inplace."""
+    energy_cost_list = []
+    for i in range(len(df)):
+        # Get electricity used and hour of day
+        energy_used = df.iloc[i]['energy_kwh']
+        hour = df.index[i].hour
+        energy_cost = apply_tariff(energy_used, hour)
+        energy_cost_list.append(energy_cost)
+    df['cost_cents'] = energy_cost_list
+
+
+def apply_tariff_iterrows(df):
+    energy_cost_list = []
+    for index, row in df.iterrows():
+        # Get electricity used and hour of day
+        energy_used = row['energy_kwh']
+        hour = index.hour
+        # Append cost list
+        energy_cost = apply_tariff(energy_used, hour)
+        energy_cost_list.append(energy_cost)
+    df['cost_cents'] = energy_cost_list
+
+
+def apply_tariff_withapply(df):
+    df['cost_cents'] = df.apply(
+        lambda row: apply_tariff(
+            kwh=row['energy_kwh'],
+            hour=row.name.hour),
+        axis=1)
+
+
+def apply_tariff_isin(df):
+    # Define hour range Boolean arrays
+    peak_hours = df.index.hour.isin(range(17, 24))
+    shoulder_hours = df.index.hour.isin(range(7, 17))
+    off_peak_hours = df.index.hour.isin(range(0, 7))
+
+    # Apply tariffs to hour ranges
+    df.loc[peak_hours, 'cost_cents'] = df.loc[peak_hours, 'energy_kwh'] * 28
+    df.loc[shoulder_hours, 'cost_cents'] = df.loc[shoulder_hours, 'energy_kwh'] * 20
+    df.loc[off_peak_hours, 'cost_cents'] = df.loc[off_peak_hours, 'energy_kwh'] * 12
+
+
+def apply_tariff_cut(df):
+    # The notebook's right-closed bins put hours 7 and 17 in the band
+    # before; right=False makes them [0, 7), [7, 17), [17, 24) like the rest
+    cents_per_kwh = pd.cut(x=df.index.hour,
+                           bins=[0, 7, 17, 24],
+                           right=False,
+                           labels=[12, 20, 28]).astype(int)
+    df['cost_cents'] = cents_per_kwh * df['energy_kwh']
+
+
+def apply_tariff_digitize(df):
+    prices = np.array([12, 20, 28])
+    bins = np.digitize(df.index.hour.values, bins=[7, 17, 24])
+    df['cost_cents'] = prices[bins] * df['energy_kwh'].values
+
+
+# demand_profile.csv is day first: 13/1/13 0:00 is 13 January 2013
+DEMAND_PROFILE_FORMAT = "%d/%m/%y %H:%M"
+
+
+def stream_daily_costs(path, out_path, schedule=DEFAULT_TARIFF, chunksize=100_000,
+                       date_format=DEMAND_PROFILE_FORMAT):
+    """Write daily energy and cost totals for a demand profile CSV of any size
+
+    The CSV is read chunksize rows at a time, so memory stays bounded by
+    the chunk, not the file. Rows must be in time order. The last day of
+    each chunk may continue in the next one, so it is held back and only
+    written once a later day shows up. Returns the number of rows read.
+    """
+    pending = None
+    last_written = None
+    rows = 0
+    header = True
+    reader = pd.read_csv(path, usecols=["date_time", "energy_kwh"],
+                         dtype={"energy_kwh": "float64"}, chunksize=chunksize)
+    with open(out_path, "w", newline="") as out:
+        for chunk in reader:
+            rows += len(chunk)
+            times = pd.to_datetime(chunk["date_time"], format=date_format)
+            energy = chunk["energy_kwh"].values
+            daily = pd.DataFrame({
+                "energy_kwh": energy,
+                "cost_cents": schedule.cost(times, energy),
+            }).groupby(times.dt.normalize().values).sum()
+            daily.index.name = "date"
+
+            if pending is not None:
+                daily = pending.add(daily, fill_value=0)
+            if last_written is not None and daily.index[0] <= last_written:
+                raise ValueError(f"{path} is not in time order: "
+                                 f"{daily.index[0]:%Y-%m-%d} comes after {last_written:%Y-%m-%d}")
+            pending, done = daily.iloc[-1:], daily.iloc[:-1]
+            if len(done):
+                done.to_csv(out, header=header)
+                header = False
+                last_written = done.index[-1]
+        if pending is not None:
+            pending.to_csv(out, header=header)
+    return rows
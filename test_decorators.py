@@ -0,0 +1,135 @@
+import sys
+import types
+
+import pytest
+
+import decorators
+
+STACKED = """
+from decorators import debug, timer
+
+@timer(aggregate=True)
+@debug(buffered=True)
+def add(a, b):
+    return a + b
+"""
+
+
+def make_module(name):
+    module = types.ModuleType(name)
+    sys.modules[name] = module
+    exec(STACKED, module.__dict__)
+    return module
+
+
+def calls_recorded(module):
+    """Return (debug traced?, timer calls) after one call of module.add"""
+    decorators.DEBUG_RECORDS.clear()
+    histogram = decorators.TIMINGS[f"{module.__name__}.add"]
+    before = histogram.count
+    assert module.add(1, 2) == 3
+    return bool(decorators.DEBUG_RECORDS), histogram.count - before
+
+
+def test_disable_unwraps_whole_stack():
+    module = make_module("stacked_enabled")
+    try:
+        assert calls_recorded(module) == (True, 1)
+        decorators.disable()
+        assert calls_recorded(module) == (False, 0)
+        decorators.enable()
+        assert calls_recorded(module) == (True, 1)
+    finally:
+        decorators.enable()
+
+
+def test_enable_restores_stack_built_while_disabled():
+    decorators.disable()
+    try:
+        module = make_module("stacked_disabled")
+        assert calls_recorded(module) == (False, 0)
+        decorators.enable()
+        assert calls_recorded(module) == (True, 1)
+    finally:
+        decorators.enable()
+
+
+ALIASED = """
+from decorators import timer
+
+def work():
+    return 1
+
+timed_work = timer(aggregate=True)(work)
+"""
+
+
+def test_toggling_leaves_other_names_alone():
+    for disabled_at_import in (False, True):
+        if disabled_at_import:
+            decorators.disable()
+        try:
+            name = f"aliased_{disabled_at_import}"
+            module = types.ModuleType(name)
+            sys.modules[name] = module
+            exec(ALIASED, module.__dict__)
+            raw = module.work
+            decorators.enable()
+            assert module.work is raw
+            decorators.disable()
+            assert module.work is raw
+            decorators.enable()
+            assert module.work is raw
+            assert module.timed_work is not raw or disabled_at_import
+        finally:
+            decorators.enable()
+
+
+def test_nested_functions_are_not_remembered():
+    before = len(decorators.INSTRUMENTED)
+    for _ in range(1000):
+        @decorators.count_calls
+        def inner():
+            pass
+    assert len(decorators.INSTRUMENTED) == before
+
+
+def test_async_debug_prints_like_sync(capsys):
+    import asyncio
+
+    @decorators.debug
+    def sync_add(a, b=1):
+        return a + b
+
+    @decorators.debug
+    async def async_add(a, b=1):
+        return a + b
+
+    sync_add(2, b=3)
+    expected = capsys.readouterr().out.replace("sync_add", "add")
+    asyncio.run(async_add(2, b=3))
+    assert capsys.readouterr().out.replace("async_add", "add") == expected
+
+
+@pytest.mark.parametrize("options", [{"sample": 0}, {"max_repr": 0}])
+def test_debug_rejects_bad_options(options):
+    with pytest.raises(ValueError):
+        decorators.debug(**options)
+
+
+def test_interval_flush_leaves_other_timers_alone(capsys):
+    import time
+
+    @decorators.timer(aggregate=True)
+    def other():
+        pass
+
+    @decorators.timer(aggregate=True, flush_interval=1e-9)
+    def flushed():
+        time.sleep(0.001)
+
+    other()
+    flushed()
+    assert "flushed" in capsys.readouterr().out
+    assert other.histogram.count == 1
+    assert flushed.histogram.count == 0
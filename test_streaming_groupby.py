@@ -0,0 +1,44 @@
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from streaming_groupby import TDigest, streaming_groupby
+
+LEGISLATORS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "groupby-data", "legislators-historical.csv")
+
+
+def test_count_of_string_column():
+    result = streaming_groupby(LEGISLATORS, "state", "last_name", aggs="count", chunksize=1000)
+    expected = pd.read_csv(LEGISLATORS).groupby("state")["last_name"].count()
+    pd.testing.assert_series_equal(result["last_name"], expected)
+
+
+def test_multi_key_against_pandas():
+    aggs = ["count", "sum", "mean", "std", "min", "max"]
+    result = streaming_groupby(LEGISLATORS, ["state", "gender"], "district",
+                               aggs=aggs + ["median"], chunksize=700)
+    names = streaming_groupby(LEGISLATORS, ["state", "gender"], "last_name",
+                              aggs="count", chunksize=700)
+    df = pd.read_csv(LEGISLATORS)
+    grouped = df.groupby(["state", "gender"])
+    expected = grouped["district"].agg(aggs)
+    pd.testing.assert_frame_equal(result["district"][aggs], expected,
+                                  check_dtype=False, check_exact=False, rtol=1e-9)
+    pd.testing.assert_series_equal(names["last_name"], grouped["last_name"].count())
+
+    # Groups of at most delta values keep every value, so their median is exact
+    small = expected["count"] <= 200
+    np.testing.assert_allclose(result[("district", "median")][small],
+                               grouped["district"].median()[small])
+
+
+def test_median_rank_error_within_bound():
+    values = np.random.default_rng(0).lognormal(size=200_000)
+    digest = TDigest(delta=200)
+    for part in np.array_split(values, 16):
+        digest.update(part)
+    rank = np.searchsorted(np.sort(values), digest.quantile(0.5)) / len(values)
+    assert abs(rank - 0.5) <= math.pi / 200